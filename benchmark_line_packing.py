@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+## Benchmarks for the hot paths of line_packingV3a.py (placement, selection and mutation)
+## Usage: benchmark_line_packing.py [--output results.json] [--baseline old_results.json] [--tolerance 0.2] [--repeats 5]
+## Each timing is the average call time over a loop that runs for at least 0.2 s (like timeit's autorange), so even very short calls time reliably.
+## Results are written as JSON; with --baseline, every benchmark's fastest timing is compared to the saved one and the script exits with 1 if any got slower than the tolerance.
+
+import sys
+import timeit
+import math
+import json
+import platform
+import numpy
+from datetime import datetime
+import line_packingV3a as lp
+
+communitySizes = [10, 100, 1000] #sizes of the communities (and numbers of individuals) the benchmarks scale over
+numberOfCommunities = 20 #communities handled per timed call, so each timing covers a realistic amount of work
+
+
+def makeConfig(type_of_community, size_of_community, mutation_type="normal"): #the same commGenData/mutationData a real run would use
+	arguments = [sys.argv[0], "True", "True", "inf", "coverage", type_of_community, mutation_type, "1", str(numberOfCommunities), str(size_of_community), "0.05"]
+	return lp.makeConfig(arguments, {"seed": "0"})
+
+
+def timeIt(timer, number): #returns the time of one call in seconds, averaged over a loop of number calls
+	return timer.timeit(number)/number
+
+
+def getBenchmarks(): #returns (name, function) pairs; every function builds its inputs from a fixed seed so runs are comparable
+	benchmarks = []
+	for size in communitySizes:
+		# --- Placement
+		for type_of_community in ("homogeneous", "uniform", "n-member"):
+			config = makeConfig(type_of_community, size)
+			generation = lp.Generation.fromLists([lp.getCommunity(config["comm_gen_data"], numpy.random.default_rng(n)) for n in range(numberOfCommunities)])
+			for countmax in (200, math.inf):
+				def fill(generation=generation, countmax=countmax):
+					rng = numpy.random.default_rng(0)
+					for community in generation:
+						lp.fillIntervalInf(community, countmax, rng)
+				benchmarks.append(("fillIntervalInf/"+type_of_community+"/"+str(countmax)+"/"+str(size), fill))
+			for placement_engine in ("kinetic", "batch"):
+				def fillEngine(generation=generation, placement_engine=placement_engine):
+					lp.fillGeneration(generation, math.inf, numpy.random.default_rng(0), placement_engine)
+				benchmarks.append(("fillGeneration/"+placement_engine+"/"+type_of_community+"/inf/"+str(size), fillEngine))
+		# --- Weighted choice
+		items = list(range(size))
+		weights = numpy.random.default_rng(0).uniform(0.005, 1, size).tolist()
+		def choose(items=items, weights=weights):
+			rng = numpy.random.default_rng(0)
+			for i in range(numberOfCommunities):
+				lp.chooseFromWeight(items, weights, rng)
+		benchmarks.append(("chooseFromWeight/"+str(size), choose))
+		# --- Selection
+		config = makeConfig("uniform", size)
+		generation = lp.Generation.fromLists([lp.getCommunity(config["comm_gen_data"], numpy.random.default_rng(n)) for n in range(numberOfCommunities)])
+		for individual_selection_type in ("placement", "coverage", "coverage2"):
+			def select(generation=generation, individual_selection_type=individual_selection_type, size=size):
+				lp.selectIndividuals(True, individual_selection_type, generation, size, numpy.random.default_rng(0))
+			benchmarks.append(("selectIndividuals/"+individual_selection_type+"/"+str(size), select))
+		def selectCommunities(generation=generation):
+			lp.selectCommunitiesIndex(True, generation, numberOfCommunities, numpy.random.default_rng(0))
+		benchmarks.append(("selectCommunitiesIndex/"+str(size), selectCommunities))
+		# --- Mutation
+		for mutation_type in ("uniform", "poisson", "normal"):
+			mutation_data = makeConfig("uniform", size, mutation_type)["mutation_data"]
+			def mutate(generation=generation, mutation_data=mutation_data):
+				rng = numpy.random.default_rng(0)
+				for community in generation:
+					lp.mutateCommunity(community, mutation_data, rng)
+			benchmarks.append(("mutateCommunity/"+mutation_type+"/"+str(size), mutate))
+			def mutateAll(generation=generation, mutation_data=mutation_data):
+				lp.mutateGeneration(generation, mutation_data, numpy.random.default_rng(0))
+			benchmarks.append(("mutateGeneration/"+mutation_type+"/"+str(size), mutateAll))
+	return benchmarks
+
+
+def runBenchmarks(repeats): #times every benchmark and returns the results in the format written to the output file
+	benchmarks = []
+	for name, function in getBenchmarks(): #finds how many calls of each benchmark take at least 0.2 s (this also warms it up)
+		timer = timeit.Timer(function)
+		number, elapsed = timer.autorange()
+		benchmarks.append((name, timer, number, [elapsed/number]))
+	for repeat in range(repeats-1): #times every benchmark once per round, so a slow spell of the machine hits all of them rather than a few
+		for name, timer, number, timings in benchmarks:
+			timings.append(timeIt(timer, number))
+	results = {}
+	for name, timer, number, timings in benchmarks:
+		results[name] = {"median": float(numpy.median(timings)), "min": min(timings), "repeats": repeats, "calls_per_repeat": number}
+		print(name+": "+format(results[name]["min"]*1000, ".3f")+" ms")
+	return {"meta": {"date": datetime.now().isoformat(), "python": platform.python_version(), "numpy": numpy.__version__, "machine": platform.platform()},
+		"results": results}
+
+
+def compareToBaseline(results, baseline, tolerance): #prints the change of every benchmark's fastest timing against the baseline and returns the names of those that got slower than the tolerance
+	regressions = []
+	for name in sorted(results["results"]):
+		if name not in baseline["results"]:
+			continue
+		ratio = results["results"][name]["min"]/baseline["results"][name]["min"] #the fastest timing is the one least disturbed by the rest of the machine
+		if ratio>1+tolerance:
+			regressions.append(name)
+		print(name+": "+format(ratio, ".2f")+"x baseline"+(" REGRESSION" if ratio>1+tolerance else ""))
+	return regressions
+
+
+if __name__ == "__main__":
+	arguments, options = lp.parseOptions(sys.argv)
+	results = runBenchmarks(int(options.get("repeats", 5)))
+	output = options.get("output", "benchmark_"+datetime.now().strftime("%Y%m%d_%H%M%S")+".json")
+	with open(output, 'w') as jsonfile:
+		json.dump(results, jsonfile, indent=1)
+	print("Results written to "+output)
+	if "baseline" in options:
+		with open(options["baseline"], 'r') as jsonfile:
+			baseline = json.load(jsonfile)
+		regressions = compareToBaseline(results, baseline, float(options.get("tolerance", 0.2)))
+		if regressions:
+			print(str(len(regressions))+" benchmark(s) slower than the baseline: "+", ".join(regressions))
+			sys.exit(1)
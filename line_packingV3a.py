@@ -1,31 +1,136 @@
 #!/usr/bin/python3
 ## Written by C. Williams 8/2021
+## Usage: line_packingV3a.py individual_level_selection community_level_selection number_of_attempts individual_selection_type type_of_community mutation_type
+##	number_of_generations number_of_communities size_of_community [length_or_seed_csv [seed_label]] [--name value ...]
+## --placement-engine picks how intervals are filled: rejection (default), kinetic (rejection-free, infinite attempts only) or batch (every community of a generation at once).
+## Other options: --seed, --workers, --chunk-size, --generation-format, --coverage-output, --length-bins, --metrics, --summary-every, --flush-interval, --flush-rows; --sweep runs a sweep file (see Parameter Sweeps).
 
-import random
+import bisect
 import sys
 import numpy
 import time
 import csv
 import math
 import os.path
+import multiprocessing
+import threading
+import queue
+import json
 from datetime import datetime
 
-def chooseFromWeight(list, list_of_weights): #chooses ONE list item based on a corresponding ORDERED list of weights/probabilites (e.g. choosing from items [A, B, C, D] with weights [1, 4, 3, 2] (e.g. probability [0.1, 0.4, 0.3, 0.2]))
+def chooseFromWeight(list, list_of_weights, rng): #chooses ONE list item based on a corresponding ORDERED list of weights/probabilites (e.g. choosing from items [A, B, C, D] with weights [1, 4, 3, 2] (e.g. probability [0.1, 0.4, 0.3, 0.2]))
 	#here we will convert the list of weights into a list of "ranges," against which a random number can be checked (e.g. [1, 4, 3, 2] to [1, 5, 8, 10])
 	ordered_list_of_weights=[list_of_weights[0]] #this sets up the first item in ordered_list_of_weights
 	for i in range(1, len(list_of_weights)): #NOTE: this starts at 1 because the first element of ordered_list_of_weights has been established
 		ordered_list_of_weights.append(list_of_weights[i]+ordered_list_of_weights[i-1])
 	#print(list_of_weights)
 	#print(ordered_list_of_weights)
-	randvar=random.random()*sum(list_of_weights) #picks a random number between 0 and the sum of all weights
+	randvar=rng.random()*sum(list_of_weights) #picks a random number between 0 and the sum of all weights
 	for j in range(len(ordered_list_of_weights)): #checks that number to see what probability "range" its between; more literally, it sequentially checks whether its less than each value in the ordered list of probabilities and the first list item where that's true gets added.
 		if randvar<ordered_list_of_weights[j]:
 			return list[j]
 
 
-def getCommunity(commGenData): #generates a community with a inidividuals from a uniformed distribution
+class WeightedSampler: #draws items with probability proportional to a corresponding ORDERED list of weights, like chooseFromWeight, but builds the "ranges" (cumulative weights) once so k draws are a single searchsorted
+	def __init__(self, items, weights):
+		self.items = numpy.asarray(items)
+		self.ordered_weights = numpy.cumsum(weights) #e.g. [1, 4, 3, 2] to [1, 5, 8, 10]
+
+	def sampleIndex(self, k, rng): #returns the indices of k items, chosen independently based on their weights
+		if self.ordered_weights[-1]<=0: #no item has any weight (e.g. no community placed anything), so every item is equally likely
+			return rng.integers(len(self.ordered_weights), size=k)
+		randvar = rng.random(k)*self.ordered_weights[-1] #picks k random numbers between 0 and the sum of all weights
+		index = numpy.searchsorted(self.ordered_weights, randvar, side="right") #the first "range" each number is less than, same as the scan in chooseFromWeight
+		return numpy.minimum(index, len(self.ordered_weights)-1) #guards against randvar rounding up to the total weight
+
+	def sample(self, k, rng): #returns k items, chosen independently based on their weights
+		return self.items[self.sampleIndex(k, rng)]
+
+	def sampleIndexWithin(self, starts, stops, rng): #for each range [starts[j], stops[j]) of items, returns the index of one item from that range, chosen based on the weights within it
+		lows = numpy.where(starts>0, self.ordered_weights[numpy.maximum(starts-1, 0)], 0) #total weight before each range
+		range_weights = self.ordered_weights[numpy.maximum(stops-1, 0)]-lows
+		randoms = rng.random(len(starts))
+		index = numpy.searchsorted(self.ordered_weights, lows+randoms*range_weights, side="right")
+		index = numpy.clip(index, starts, stops-1) #guards against randvar rounding to either end of its range
+		return numpy.where(range_weights>0, index, starts+(randoms*(stops-starts)).astype(numpy.int64)) #a range with no weight at all is drawn from uniformly
+
+
+class Generation: #a whole generation stored CSR-style: one flat float64 buffer of every individual, plus offsets so community i is values[offsets[i]:offsets[i+1]]
+	def __init__(self, values, offsets):
+		self.values = values
+		self.offsets = offsets
+
+	@staticmethod
+	def fromLists(communities): #builds a generation from a list of communities (lists or arrays of lengths)
+		offsets = numpy.zeros(len(communities)+1, dtype=numpy.int64)
+		offsets[1:] = numpy.cumsum([len(community) for community in communities])
+		if offsets[-1]>0:
+			values = numpy.concatenate(communities).astype(numpy.float64, copy=False)
+		else:
+			values = numpy.zeros(0)
+		return Generation(values, offsets)
+
+	@staticmethod
+	def concatenate(generations): #joins generations one after the other
+		offsets = [numpy.zeros(1, dtype=numpy.int64)]
+		for generation in generations:
+			offsets.append(generation.offsets[1:]+offsets[-1][-1])
+		return Generation(numpy.concatenate([generation.values for generation in generations]), numpy.concatenate(offsets))
+
+	def __len__(self): #number of communities
+		return len(self.offsets)-1
+
+	def __getitem__(self, i): #community i (a view, not a copy)
+		return self.values[self.offsets[i]:self.offsets[i+1]]
+
+	def __iter__(self):
+		for i in range(len(self)):
+			yield self[i]
+
+	def sizes(self): #number of individuals in each community
+		return numpy.diff(self.offsets)
+
+	def communityIndex(self): #which community each individual belongs to
+		return numpy.repeat(numpy.arange(len(self)), self.sizes())
+
+	def coverage(self): #sum of each community, adding its individuals one after the other like sum(community) does, so every value is exactly the same
+		sizes = self.sizes()
+		order = numpy.argsort(-sizes, kind="stable") #largest communities first, so the communities with more than k individuals are always a prefix of order
+		starts = self.offsets[:-1][order]
+		remaining = len(sizes)-numpy.cumsum(numpy.bincount(sizes, minlength=1)) #remaining[k] is the number of communities with more than k individuals
+		partial = numpy.zeros(len(sizes))
+		for k in range(len(remaining)-1): #adds the k-th individual of every community that has one
+			n = remaining[k]
+			partial[:n] = partial[:n]+self.values[starts[:n]+k]
+		coverage = numpy.zeros(len(sizes))
+		coverage[order] = partial
+		return coverage
+
+	def slice(self, start, stop): #communities start to stop-1 as a new generation (the values are a view)
+		stop = min(stop, len(self))
+		return Generation(self.values[self.offsets[start]:self.offsets[stop]], self.offsets[start:stop+1]-self.offsets[start])
+
+	def take(self, index): #a new generation made of the communities at index (repeats allowed), in that order
+		index = numpy.asarray(index, dtype=numpy.int64)
+		sizes = self.sizes()[index]
+		offsets = numpy.zeros(len(index)+1, dtype=numpy.int64)
+		offsets[1:] = numpy.cumsum(sizes)
+		#position of every individual of the new generation in self.values: the start of its old community plus its position within it
+		positions = numpy.repeat(self.offsets[index]-offsets[:-1], sizes)+numpy.arange(offsets[-1])
+		return Generation(self.values[positions], offsets)
+
+	def mask(self, keep): #a new generation keeping only the individuals where keep is True (communities may become empty)
+		offsets = numpy.zeros(len(self)+1, dtype=numpy.int64)
+		offsets[1:] = numpy.cumsum(numpy.bincount(self.communityIndex()[keep], minlength=len(self)))
+		return Generation(self.values[keep], offsets)
+
+	def toLists(self):
+		return [community.tolist() for community in self]
+
+
+def getCommunity(commGenData, rng): #generates a community with a inidividuals from a uniformed distribution
 	if commGenData["type_of_community"]=="uniform":
-		community = [random.uniform(commGenData["min_length"], commGenData["max_length"]) for x in range(commGenData["size_of_community"])]
+		community = rng.uniform(commGenData["min_length"], commGenData["max_length"], commGenData["size_of_community"]).tolist()
 	elif commGenData["type_of_community"]=="homogeneous":
 		community = [commGenData["length"] for x in range(commGenData["size_of_community"])]
 	elif commGenData["type_of_community"]=="n-member":
@@ -43,188 +148,749 @@ def getCommunity(commGenData): #generates a community with a inidividuals from a
 				length_probability_list.append((commGenData["community_weight_list"][j]*commGenData["size_of_community"]-int(commGenData["size_of_community"]*commGenData["community_weight_list"][j]))/(commGenData["size_of_community"]-len(community)))
 
 			while len(community)<commGenData["size_of_community"]: #fills remaining spaces in community
-				community.append(chooseFromWeight(commGenData["length_list"], length_probability_list))
+				community.append(chooseFromWeight(commGenData["length_list"], length_probability_list, rng))
 	else:
 		print("Incorrect starting community type entered. Please choose from uniform, homogeneous, or n-member.")
 		sys.exit()
 	return community #returns the community
 
 
-def importGeneration(filename): #imports an existing generation from a csv file
+generationFormats = ["binary", "csv", "both"] #the formats collected generations can be written in, chosen with --generation-format
+
+
+def writeGeneration(generation, filename): #writes a binary snapshot of a generation: the offsets and then the values, each as a .npy record, one after the other in the same file
+	with open(filename,'wb') as genfile:
+		numpy.lib.format.write_array(genfile, numpy.ascontiguousarray(generation.offsets, dtype=numpy.int64))
+		numpy.lib.format.write_array(genfile, numpy.ascontiguousarray(generation.values, dtype=numpy.float64))
+
+
+def writeGenerationCSV(generation, filename): #writes a generation as a csv file, one community per row
+	with open(filename, 'w') as csvfile:
+		csvwriter = csv.writer(csvfile)
+		csvwriter.writerows(generation.toLists())
+
+
+class BackgroundWriter: #writes output files from a background thread, so the generation loop only ever queues work and never waits on disk
+	def __init__(self, flush_interval, flush_rows):
+		self.flush_interval = flush_interval #seconds between flushes of the open files
+		self.flush_rows = flush_rows #number of rows written before the open files are flushed early
+		self.tasks = queue.Queue() #unbounded, so putting never blocks
+		self.files = {} #one open handle (and csv writer) per output file
+		self.error = None
+		self.failed = set() #files that hit an error; anything more queued for them is dropped
+		self.closed = False #set by the writer thread once it has written everything queued before close
+		self.thread = threading.Thread(target=self.run, daemon=True)
+		self.thread.start()
+
+	def writeRow(self, filename, row): #appends one csv row to filename
+		self.tasks.put(("row", filename, row))
+
+	def writeLine(self, filename, line): #appends one line of text to filename
+		self.tasks.put(("line", filename, line))
+
+	def writeGeneration(self, generation, filename): #writes a whole generation snapshot (binary, or csv for .csv filenames). The generation must not be modified afterwards
+		self.tasks.put(("generation", filename, generation))
+
+	def close(self): #writes everything still queued, closes all files and re-raises any error the writer thread hit
+		self.tasks.put(None)
+		self.thread.join()
+		if self.error is not None:
+			raise self.error
+		if not self.closed: #the thread ended some other way, so part of the output may never have been written
+			raise RuntimeError("The background writer stopped before writing all of the output.")
+
+	def recordError(self, error): #keeps the first error, to be re-raised by close
+		if self.error is None:
+			self.error = error
+
+	def flush(self): #flushes every open file; a file that fails to flush (or write) is not flushed or written to again
+		for filename, (csvfile, csvwriter) in self.files.items():
+			if filename not in self.failed:
+				try:
+					csvfile.flush()
+				except Exception as error:
+					self.failed.add(filename)
+					self.recordError(error)
+		self.rows_since_flush = 0
+		self.last_flush = time.time()
+
+	def shutdown(self): #flushes and closes every file; never raises, so the thread always ends
+		self.flush()
+		for csvfile, csvwriter in self.files.values():
+			try:
+				csvfile.close()
+			except Exception as error:
+				self.recordError(error)
+
+	def run(self):
+		self.rows_since_flush = 0
+		self.last_flush = time.time()
+		while True:
+			try:
+				task = self.tasks.get(timeout=self.flush_interval)
+			except queue.Empty:
+				task = "flush"
+			except Exception as error: #the queue itself failed, so nothing more can be written; close reports the error
+				self.recordError(error)
+				self.shutdown()
+				return
+			if task is None: #shutting down
+				self.shutdown()
+				self.closed = True
+				return
+			filename = None
+			try:
+				if task!="flush":
+					kind, filename, data = task
+					if filename in self.failed:
+						pass
+					elif kind in ("row", "line"):
+						if filename not in self.files:
+							csvfile = open(filename, 'a')
+							self.files[filename] = (csvfile, csv.writer(csvfile))
+						if kind=="row":
+							self.files[filename][1].writerow(data.tolist() if isinstance(data, numpy.ndarray) else data)
+						else:
+							self.files[filename][0].write(data+"\n")
+						self.rows_since_flush = self.rows_since_flush+1
+					elif filename.endswith(".csv"):
+						writeGenerationCSV(data, filename)
+					else:
+						writeGeneration(data, filename)
+				if self.rows_since_flush>=self.flush_rows or time.time()-self.last_flush>=self.flush_interval:
+					self.flush()
+			except Exception as error: #keep draining the queue so the main loop can't stall, and report the first error on close
+				if filename is not None:
+					self.failed.add(filename)
+				self.recordError(error)
+
+
+def loadGeneration(filename): #loads a binary snapshot written by writeGeneration; the values are memory-mapped rather than read, so even huge snapshots load instantly
+	with open(filename,'rb') as genfile:
+		offsets = numpy.lib.format.read_array(genfile)
+		version = numpy.lib.format.read_magic(genfile)
+		if version==(1, 0):
+			shape, fortran_order, dtype = numpy.lib.format.read_array_header_1_0(genfile)
+		else:
+			shape, fortran_order, dtype = numpy.lib.format.read_array_header_2_0(genfile)
+		values_start = genfile.tell()
+	if shape[0]==0: #an empty file region can't be memory-mapped
+		return Generation(numpy.zeros(0), offsets)
+	return Generation(numpy.memmap(filename, dtype=dtype, mode='r', offset=values_start, shape=shape), offsets)
+
+
+def importGeneration(filename): #imports an existing generation from a binary snapshot (recognised by the .npy header it starts with, whatever its name) or a csv file
+	with open(filename,'rb') as genfile:
+		is_snapshot = genfile.read(len(numpy.lib.format.MAGIC_PREFIX))==numpy.lib.format.MAGIC_PREFIX
+	if is_snapshot:
+		return loadGeneration(filename)
 	with open(filename,'r') as csvfile:
 		generationfile=csv.reader(csvfile, quoting=csv.QUOTE_NONNUMERIC) #NOTE: this converts ALL non-quoted values to floats. Keep this in mind.
 		generation = []
 		for row in generationfile:
 			if row: #this removes blank rows
 				generation.append(row) 
-	return generation
+	return Generation.fromLists(generation)
+
+
 
 
+mutationTypes = ["uniform", "poisson", "normal"] #the distributions drawMutations can draw from
 
 
 #the following mutation funtions differ only in the distribution on which mutations are generated
-#NOTE: these modifies the community variable ITSELF, so be careful if you need to use the starting community later
-def mutateCommunity(community, mutationData):
-	number_of_mutations = numpy.random.binomial(len(community), mutationData["mutation_probability"]) #choose a number of elements to mutate based on a binomial distribution
-	# --- Generate mutations
+def drawMutations(mutationData, number_of_mutations, rng): #generates number_of_mutations (positive) mutation sizes
 	if mutationData["mutation_type"]=="uniform":
-		mutation_list = abs(numpy.random.uniform(mutationData["min_mutation_size"],mutationData["max_mutation_size"],number_of_mutations)) #generate POSITIVE mutations based on a uniformed distribution #NOT DISCRETE
+		mutation_list = abs(rng.uniform(mutationData["min_mutation_size"],mutationData["max_mutation_size"],number_of_mutations)) #generate POSITIVE mutations based on a uniformed distribution #NOT DISCRETE
 	elif mutationData["mutation_type"]=="poisson":
-		mutation_list = numpy.random.poisson(mutationData["mutation_mean_size"], number_of_mutations) #generates mutations based on a poisson distribution #this is, of course, inherently DISCRETE
+		mutation_list = rng.poisson(mutationData["mutation_mean_size"], number_of_mutations) #generates mutations based on a poisson distribution #this is, of course, inherently DISCRETE
 	elif mutationData["mutation_type"]=="normal":
-		mutation_list = abs(numpy.random.normal(0,mutationData["mutation_standard_deviation"],number_of_mutations)) #generates POSITIVE mutations based on a normal distribution 
-		mutation_list = [round(x/mutationData["mutation_delta"])*mutationData["mutation_delta"] for x in mutation_list] #this converts all mutations to factors of mutation_delta (e.g. discretizies segment sizes)
+		mutation_list = abs(rng.normal(0,mutationData["mutation_standard_deviation"],number_of_mutations)) #generates POSITIVE mutations based on a normal distribution 
+		mutation_list = numpy.round(mutation_list/mutationData["mutation_delta"])*mutationData["mutation_delta"] #this converts all mutations to factors of mutation_delta (e.g. discretizies segment sizes)
 	else:
-		print("Incorrect mutation type entered. Please choose from uniform, homogeneous, or n-member.")
+		print("Incorrect mutation type entered. Please choose from uniform, poisson, or normal.")
 		sys.exit()
-	mutation_list = [min(max(mutationData["min_mutation_size"], x), mutationData["max_mutation_size"]) for x in mutation_list] #caps all mutations
+	return numpy.clip(mutation_list, mutationData["min_mutation_size"], mutationData["max_mutation_size"]) #caps all mutations
+
+
+#NOTE: this returns a new array; the community passed in is left unchanged
+def mutateCommunity(community, mutationData, rng):
+	number_of_mutations = rng.binomial(len(community), mutationData["mutation_probability"]) #choose a number of elements to mutate based on a binomial distribution
+	mutation_list = drawMutations(mutationData, number_of_mutations, rng) # --- Generate mutations
 	# --- Choose individuals to mutate
-	segments_to_mutate = random.sample(range(len(community)), number_of_mutations) #choose which elements will be mutated
-	for j in range(number_of_mutations): #modifies the segments_to_mutate according to their chosen mutation
-		community[segments_to_mutate[j]] = community[segments_to_mutate[j]] + random.choice((-1, 1))*mutation_list[j] #adds +/- the respective mutation
-	culled_community=[x for x in community if x>=minSegmentSize and x<=maxSegmentSize] #this removes all line segments less than or equal to minSegmentSize (or rather, creates a new list only keeping positive valued ones)
+	segments_to_mutate = rng.choice(len(community), number_of_mutations, replace=False) #choose which elements will be mutated
+	mutation_signs = rng.choice((-1, 1), number_of_mutations) #whether each mutation grows or shrinks its segment
+	community = numpy.array(community, dtype=numpy.float64) #copy, so the community passed in is not modified
+	community[segments_to_mutate] = community[segments_to_mutate] + mutation_signs*mutation_list #adds +/- the respective mutation (segments_to_mutate has no repeats)
+	culled_community=community[(community>=mutationData["min_segment_size"]) & (community<=mutationData["max_segment_size"])] #this removes all line segments less than or equal to min_segment_size (or rather, only keeps the ones inside the allowed sizes)
 	return culled_community
 
 
-def fillIntervalInf(community, countmax=math.inf): #this function fills the interval with segments, by filling and then generating new gaps in the interval
-	starts = [] #record of where line segments were successfully placed
-	ends = [] #record of where line segments end
-	gaps = [1] #records gaps available to place segments in
+def mutateGeneration(generation, mutationData, rng): #mutates every individual of every community of a Generation at once; same distribution as mutateCommunity on each community
+	#a binomial number of mutations placed on a random sample of individuals is the same as mutating each individual independently with mutation_probability
+	values = generation.values.copy() #copy, so the generation passed in is not modified
+	segments_to_mutate = rng.random(len(values))<mutationData["mutation_probability"] #choose which elements will be mutated
+	number_of_mutations = numpy.count_nonzero(segments_to_mutate)
+	mutation_list = drawMutations(mutationData, number_of_mutations, rng) # --- Generate mutations
+	mutation_signs = rng.choice((-1, 1), number_of_mutations) #whether each mutation grows or shrinks its segment
+	values[segments_to_mutate] = values[segments_to_mutate] + mutation_signs*mutation_list #adds +/- the respective mutation
+	return Generation(values, generation.offsets).mask((values>=mutationData["min_segment_size"]) & (values<=mutationData["max_segment_size"])) #culls line segments outside the allowed sizes
+
+
+class GapIndex: #keeps the gaps of the interval as bisect-maintained sorted boundaries, so finding/splitting a gap and querying the largest gap is logarithmic (or an insert into a sorted list) instead of rebuilding arrays on every placement
+	def __init__(self):
+		self.lefts = [0] #left edge of each gap, in order along the interval (i.e. [0]+ends)
+		self.rights = [1] #right edge of each gap, in order along the interval (i.e. starts+[1])
+		self.sizes = [1] #sorted sizes of all gaps, so the largest gap is always sizes[-1]
+
+	def findGap(self, placement, length): #returns the index of the gap a segment of this length can be placed in at placement, or -1 if the placement is invalid, p in (ends, starts-length)
+		k = bisect.bisect_left(self.lefts, placement)-1 #the last gap starting strictly before placement; it is the only gap placement can be in
+		if k>=0 and placement<self.rights[k]-length:
+			return k
+		return -1
+
+	def place(self, k, placement, length): #splits gap k around a segment placed at placement
+		del self.sizes[bisect.bisect_left(self.sizes, self.rights[k]-self.lefts[k])] #remove the old gap size (computed the same way it was inserted, so the lookup is exact)
+		self.lefts.insert(k+1, placement+length)
+		self.rights.insert(k, placement)
+		bisect.insort(self.sizes, self.rights[k]-self.lefts[k])
+		bisect.insort(self.sizes, self.rights[k+1]-self.lefts[k+1])
+
+	def maxGap(self):
+		return self.sizes[-1]
+
+	def gapsLargerThan(self, length): #returns all gap sizes strictly larger than length
+		return self.sizes[bisect.bisect_right(self.sizes, length):]
+
+
+def endGame(useable_community, useable_gaps, rng): #places exactly one segment in each gap, once every gap can only fit at MOST one more segment. useable_community must be sorted
+	list_of_segments=[]
+	for gap in useable_gaps: #for each viable gap
+		useable_community_temp = useable_community[:numpy.searchsorted(useable_community, gap)] #select all useable segments FOR this gap
+		useable_community_weight = [(gap-ind)/gap for ind in useable_community_temp] #calculate probability of placement for each segment
+		x = chooseFromWeight(useable_community_temp, useable_community_weight, rng) #choose a segment based on its weight
+		list_of_segments.append(x) #append that segment to the list
+	return list_of_segments
+
+
+def randomStream(rng, block_size=1024): #yields uniform random numbers in [0,1) one at a time, drawing them from rng in blocks so loops that need one number per step don't pay for a Generator call each time
+	while True:
+		yield from rng.random(block_size).tolist()
+
+
+def searchPrefixWeight(prefix_counts, prefix_mass, gap, fitting, randvar): #chooses a length for a gap, with weight (number of copies)*(gap-length): returns the smallest j < fitting with prefix_counts[j+1]*gap-prefix_mass[j+1] > randvar, for randvar in [0, prefix_counts[fitting]*gap-prefix_mass[fitting])
+	#prefix_counts[i] and prefix_mass[i] are the number and summed length of the individuals with the i shortest (sorted) lengths; fitting is how many of those lengths are shorter than the gap
+	low = 0
+	high = fitting-1
+	while low<high:
+		mid = (low+high)//2
+		if prefix_counts[mid+1]*gap-prefix_mass[mid+1]>randvar:
+			high = mid
+		else:
+			low = mid+1
+	return low
+
+
+maxDistinctLengths = 16 #with infinite attempts, communities with at most this many distinct lengths (e.g. homogeneous and n-member) are filled by fillIntervalDistinct
+
+
+def fillIntervalDistinct(lengths, counts, rng): #fills the interval (infinite attempts) for a community given as its sorted distinct lengths and how many of each it has
+	#Once a gap exists, what ends up in it doesn't depend on any other gap, so each gap is filled on its own: a length is chosen with weight
+	#count*(gap-length) (the acceptance area of all copies of that length) and placed uniformly in the valid region, leaving two smaller gaps.
+	#A gap under twice the shortest length can only take one more segment, so it goes straight to the end-game choice without drawing a position.
+	#This gives the same distribution as fillIntervalInf, in time proportional to the number of gaps times log(number of distinct lengths).
+	prefix_counts = [0] #prefix_counts[i] is the number of individuals with one of the i shortest lengths
+	prefix_mass = [0] #prefix_mass[i] is the summed length of those individuals
+	for j in range(len(lengths)):
+		prefix_counts.append(prefix_counts[-1]+counts[j])
+		prefix_mass.append(prefix_mass[-1]+counts[j]*lengths[j])
+	randoms = randomStream(rng)
+	list_of_segments=[]
+	unfilled_gaps = [1] #gaps that may still fit a segment
+	while unfilled_gaps:
+		gap = unfilled_gaps.pop()
+		fitting = bisect.bisect_left(lengths, gap) #number of distinct lengths shorter than the gap
+		if fitting==0:
+			continue
+		# --- choose a length with weight count*(gap-length)
+		length = lengths[searchPrefixWeight(prefix_counts, prefix_mass, gap, fitting, next(randoms)*(prefix_counts[fitting]*gap-prefix_mass[fitting]))]
+		list_of_segments.append(length)
+		if gap<2*lengths[0]: #end-game for this gap: nothing fits next to the segment
+			continue
+		placement = next(randoms)*(gap-length) #uniform position in the valid region of the gap
+		unfilled_gaps.append(placement)
+		unfilled_gaps.append(gap-placement-length)
+	return list_of_segments
+
+
+def fillIntervalInf(community, countmax, rng, stats=None): #this function fills the interval with segments, by filling and then generating new gaps in the interval. If stats is a dict, its "attempts" and "accepted" (random placements) or "draws" (segments placed without rejection) are increased
+	if countmax==math.inf:
+		lengths, counts = numpy.unique(community, return_counts=True)
+		if 0<len(lengths)<=maxDistinctLengths: #only a few distinct lengths: fill gap by gap instead of by random attempts
+			list_of_segments = fillIntervalDistinct(lengths.tolist(), counts.tolist(), rng)
+			if stats is not None: #every draw places a segment, so these are not attempts of the rejection loop
+				stats["draws"] = stats["draws"]+len(list_of_segments)
+			return list_of_segments
+	gaps = GapIndex() #records gaps available to place segments in
 	list_of_segments=[] #sets up a (currently empty) list of segments which made it onto the community
-	useable_community = numpy.array(community) #we will remove line segments from useable_community
+	useable_community = numpy.sort(community) #we will remove line segments from useable_community; kept sorted so min(useable_community) is useable_community[0] and filtering by gap size is a slice
 
+	randoms = randomStream(rng)
+
+	accepted = None #number of segments placed by random attempts, if the end-game was reached
 	count = 0 #for when I wanna do count
-	while any(numpy.array(gaps)>min(useable_community)): #while there's space for a segment in any of our gaps
+	while len(useable_community)>0 and gaps.maxGap()>useable_community[0]: #while there's space for a segment in any of our gaps
 		count = count+1 #for when I wanna do count
-		placement = random.random() #pick a random point 
+		placement = next(randoms) #pick a random point 
 		if countmax==math.inf: #update placement to stay within range of plausible values, [0,1-x] where x is min length (ONLY FOR INFINITE)
-			placement=placement*(1-min(useable_community))
-		length = random.choice(useable_community) #pick a random length
+			placement=placement*(1-useable_community[0])
+		length = useable_community[int(next(randoms)*len(useable_community))] #pick a random length
 		#print(length)
-		if any(numpy.logical_and(numpy.array([0]+ends)<placement, placement<numpy.array([x-length for x in starts+[1]]))): #if point is within a valid placement, p in [ends, starts)
-			starts.append(placement) #add the new placement to the list
-			ends.append(placement+length)
+		k = gaps.findGap(placement, length)
+		if k>=0: #if point is within a valid placement, p in [ends, starts)
+			gaps.place(k, placement, length) # Update gaps to account for new segment
 			list_of_segments.append(length) #add successful segment length to list
-			
-			# Update gaps to account for new segment
-			starts.sort()
-			ends.sort()
-			gaps = numpy.subtract(starts+[1], [0]+ends) #check size of gaps
-			#print(gaps)
 
 			if countmax==math.inf: # Update useable_community so we only try to place line segments that have a chance of fitting (ONLY FOR INFINITE)
-				useable_community = useable_community[useable_community<max(gaps)]
+				useable_community = useable_community[:numpy.searchsorted(useable_community, gaps.maxGap())]
 			if len(useable_community)==0: #if there's no more useable communities
 				break #quit early to prevent next step from breaking
-			if countmax==math.inf and max(gaps)<2*min(useable_community): #if not running finite AND all remaining gaps can only fit at MOST one more segment
-				useable_gaps = numpy.array(gaps)[numpy.array(gaps)>min(useable_community)] #select all gaps that can fit at least one segment
+			if countmax==math.inf and gaps.maxGap()<2*useable_community[0]: #if not running finite AND all remaining gaps can only fit at MOST one more segment
+				useable_gaps = gaps.gapsLargerThan(useable_community[0]) #select all gaps that can fit at least one segment
 				#print(useable_gaps)
 				#print(list_of_segments)
-				for gap in useable_gaps: #for each viable gap
-					useable_community_temp = useable_community[useable_community<gap] #select all useable segments FOR this gap
-					useable_community_weight = [(gap-ind)/gap for ind in useable_community_temp] #calculate probability of placement for each segment
-					x = chooseFromWeight(useable_community_temp, useable_community_weight) #choose a segment based on its weight
-					list_of_segments.append(x) #append that segment to the list
+				accepted = len(list_of_segments) #everything before the end-game was placed by a random attempt
+				list_of_segments.extend(endGame(useable_community, useable_gaps, rng))
 				break #quit the loop early
 		if count>=countmax:
 			break
+	if stats is not None:
+		stats["attempts"] = stats["attempts"]+count
+		stats["accepted"] = stats["accepted"]+(len(list_of_segments) if accepted is None else accepted)
 	return(list_of_segments) ###TOGGLE FOR COVERAGE
 	#return(count) #for when I wanna do count ###TOGGLE FOR COUNT
 
 
-def selectCommunitiesIndex(community_level_selection_toggle, successful_individual_generation, number_of_communities):
+class WeightTree: #Fenwick (binary indexed) tree of non-negative weights, so a single weight can be changed and a slot drawn proportionally to its weight in O(log n)
+	def __init__(self, size):
+		self.size = size
+		self.tree = [0.0]*(size+1)
+		self.weights = [0.0]*size #the current weight of each slot
+		self.total = 0.0
+		self.top = 1 #highest power of two <= size, where the descent in findSlot starts
+		while self.top*2<=size:
+			self.top = self.top*2
+
+	def setWeight(self, slot, weight):
+		delta = weight-self.weights[slot]
+		self.weights[slot] = weight
+		self.total = self.total+delta
+		i = slot+1
+		while i<=self.size:
+			self.tree[i] = self.tree[i]+delta
+			i = i+(i & -i)
+
+	def findSlot(self, randvar): #returns the slot whose cumulative weight range contains randvar, with randvar in [0, total)
+		slot = 0
+		step = self.top
+		while step>0:
+			if slot+step<=self.size and self.tree[slot+step]<=randvar:
+				slot = slot+step
+				randvar = randvar-self.tree[slot]
+			step = step//2
+		return min(slot, self.size-1)
+
+
+def fillIntervalKinetic(community, rng): #rejection-free version of fillIntervalInf with countmax=inf: every draw places a segment
+	#A random placement in fillIntervalInf (infinite) is accepted with probability proportional to the length of the valid region, gap-length, so
+	#rejected attempts never change the interval. Sampling (gap, length) pairs with weight max(gap-length, 0) and then a uniform position in the
+	#valid region gives exactly the same sequence of placements (and the same jamming limit), without drawing any of the rejected attempts.
+	lengths = numpy.sort(community).tolist() #sorted so the lengths that fit in a gap are a prefix of the list
+	prefix = [0] #prefix[i] is the sum of the i smallest lengths
+	for x in lengths:
+		prefix.append(prefix[-1]+x)
+	prefix_counts = range(len(lengths)+1) #prefix_counts[i] is the number of lengths in prefix[i]
+	list_of_segments=[]
+	if len(lengths)==0:
+		return list_of_segments
+	def gapWeight(gap): #total acceptance area of a gap, sum over lengths of max(gap-length, 0)
+		c = bisect.bisect_left(lengths, gap)
+		return c*gap-prefix[c]
+
+	randoms = randomStream(rng)
+
+	number_of_slots = int(1/max(lengths[0], 1e-9))+2 #each placed segment is at least lengths[0] long, so there can never be more gaps than this
+	weights = WeightTree(number_of_slots)
+	lefts = [0]*number_of_slots #left edge of the gap in each slot
+	rights = [1]*number_of_slots #right edge of the gap in each slot
+	weights.setWeight(0, gapWeight(1))
+	used_slots = 1
+	live_gaps = 1 if weights.weights[0]>0 else 0 #number of gaps that can still fit at least one segment
+	while live_gaps>0:
+		slot = weights.findSlot(next(randoms)*weights.total) #choose a gap based on its acceptance area
+		if weights.weights[slot]<=0: #can only happen through floating point error in the tree sums; just draw again
+			continue
+		gap = rights[slot]-lefts[slot]
+		# --- choose a length in this gap with weight gap-length (every length is its own entry, so the prefix counts are just 0, 1, 2, ...)
+		length = lengths[searchPrefixWeight(prefix_counts, prefix, gap, bisect.bisect_left(lengths, gap), next(randoms)*weights.weights[slot])]
+		placement = lefts[slot]+next(randoms)*(gap-length) #uniform position in the valid region of the gap
+		list_of_segments.append(length)
+		# --- split the gap: the left piece stays in this slot, the right piece goes in a new slot
+		lefts[used_slots] = placement+length
+		rights[used_slots] = rights[slot]
+		rights[slot] = placement
+		live_gaps = live_gaps-1
+		for s in (slot, used_slots):
+			w = gapWeight(rights[s]-lefts[s])
+			weights.setWeight(s, w)
+			if w>0:
+				live_gaps = live_gaps+1
+		used_slots = used_slots+1
+	return list_of_segments
+
+
+def fillGenerationBatch(generation, countmax, rng, stats=None): #fills the intervals of every community in a Generation at once, advancing all communities in lockstep with numpy arrays (same results as fillIntervalInf on each community)
+	#Each row of the (padded) arrays below is one community. The gaps of a row are kept in the order they were created rather than along the
+	#interval; the validity check is an any() over all gaps of a row, so the order does not matter. Unused gap slots have left 2 and right 0 so
+	#they can never accept a placement.
+	number_of_communities = len(generation)
+	sizes = generation.sizes()
+	if number_of_communities==0 or sizes.max()==0:
+		return Generation(numpy.zeros(0), numpy.zeros(number_of_communities+1, dtype=numpy.int64))
+	list_of_segments = [[] for c in range(number_of_communities)] #segments placed by the end-game
+	lengths = numpy.full((number_of_communities, sizes.max()), numpy.inf) #sorted lengths of each community, padded with inf
+	community_index = generation.communityIndex()
+	order = numpy.lexsort((generation.values, community_index)) #sorts by length within each community
+	lengths[community_index, numpy.arange(len(order))-generation.offsets[community_index]] = generation.values[order]
+	min_length = lengths[:,0] #the filtering in infinite mode only ever removes the longest lengths, so this never changes
+	useable = sizes.copy() #number of useable lengths (a prefix of each row of lengths)
+	infinite = countmax==math.inf
+
+	capacity = 16 #number of gap slots per community, doubled whenever a community runs out
+	lefts = numpy.full((number_of_communities, capacity), 2.0)
+	rights = numpy.zeros((number_of_communities, capacity))
+	lefts[:,0] = 0
+	rights[:,0] = 1
+	segments = numpy.zeros((number_of_communities, capacity)) #successfully placed lengths of each community
+	number_of_gaps = numpy.ones(number_of_communities, dtype=int)
+	max_gap = numpy.ones(number_of_communities)
+	count = numpy.zeros(number_of_communities)
+	finished = sizes==0 #communities which have been completed by the end-game (or had nothing to place)
+
+	active = numpy.flatnonzero(~finished & (max_gap>min_length))
+	while len(active)>0:
+		placement = rng.random(len(active)) #pick a random point for every active community
+		if infinite: #update placement to stay within range of plausible values, [0,1-x] where x is min length (ONLY FOR INFINITE)
+			placement = placement*(1-min_length[active])
+		length = lengths[active, (rng.random(len(active))*useable[active]).astype(int)] #pick a random length for every active community
+		valid = (lefts[active]<placement[:,None]) & (placement[:,None]<rights[active]-length[:,None]) #p in (ends, starts-length) for each gap
+		count[active] = count[active]+1
+		accepted = valid.any(axis=1)
+		placed = active[accepted]
+		if len(placed)>0:
+			# --- split the chosen gap: the left piece stays in its slot, the right piece goes in the next free slot
+			gap = valid[accepted].argmax(axis=1)
+			placement = placement[accepted]
+			length = length[accepted]
+			new_gap = number_of_gaps[placed]
+			segments[placed, new_gap-1] = length
+			lefts[placed, new_gap] = placement+length
+			rights[placed, new_gap] = rights[placed, gap]
+			rights[placed, gap] = placement
+			number_of_gaps[placed] = new_gap+1
+			max_gap[placed] = (rights[placed]-lefts[placed]).max(axis=1)
+			if infinite: # Update useable so we only try to place line segments that have a chance of fitting (ONLY FOR INFINITE)
+				useable[placed] = (lengths[placed]<max_gap[placed,None]).sum(axis=1)
+				for c in placed[(useable[placed]>0) & (max_gap[placed]<2*min_length[placed])]: #all remaining gaps can only fit at MOST one more segment
+					gaps = rights[c,:number_of_gaps[c]]-lefts[c,:number_of_gaps[c]]
+					list_of_segments[c] = endGame(lengths[c,:useable[c]], gaps[gaps>min_length[c]], rng)
+					finished[c] = True
+			if number_of_gaps.max()==capacity: #make room for more gaps
+				lefts = numpy.concatenate((lefts, numpy.full((number_of_communities, capacity), 2.0)), axis=1)
+				rights = numpy.concatenate((rights, numpy.zeros((number_of_communities, capacity))), axis=1)
+				segments = numpy.concatenate((segments, numpy.zeros((number_of_communities, capacity))), axis=1)
+				capacity = capacity*2
+		active = numpy.flatnonzero(~finished & (count<countmax) & (max_gap>min_length) & (useable>0))
+
+	if stats is not None:
+		stats["attempts"] = stats["attempts"]+int(count.sum())
+		stats["accepted"] = stats["accepted"]+int((number_of_gaps-1).sum())
+	return Generation.fromLists([numpy.concatenate((segments[c,:number_of_gaps[c]-1], list_of_segments[c])) for c in range(number_of_communities)])
+
+
+placementEngines = ["rejection", "kinetic", "batch"] #the ways fillGeneration can fill intervals, chosen with --placement-engine
+
+
+def fillGeneration(generation, countmax, rng, placement_engine="rejection", stats=None): #fills a interval for each community in a Generation, returning a Generation of the successfully placed individuals for each
+	if placement_engine=="batch":
+		return fillGenerationBatch(generation, countmax, rng, stats)
+	if placement_engine=="kinetic" and countmax==math.inf: #the rejection-free mode only exists for infinite attempts; finite runs need the rejected attempts to count
+		successful_generation = Generation.fromLists([fillIntervalKinetic(community, rng) for community in generation])
+		if stats is not None: #every draw places a segment, so these are not attempts of the rejection loop
+			stats["draws"] = stats["draws"]+len(successful_generation.values)
+		return successful_generation
+	return Generation.fromLists([fillIntervalInf(community, countmax, rng, stats) for community in generation])
+
+
+def selectCommunitiesIndex(community_level_selection_toggle, successful_individual_generation, number_of_communities, rng):
 	next_generation_communities_index=[]
 	if community_level_selection_toggle == True: #chooses the next generation based proportionally on how successful a community was
-		weight_of_communities=[] #this will be filled with the "weigth" of each community, which will then determine how likely it is to pass into the next generation
-		for successful_individual_community in successful_individual_generation: #sets the weight of each community by summing it
-			weight_of_communities.append(sum(successful_individual_community))
-		for i in range(number_of_communities): #this does the actual SELECTING of communities for the next generation. It loops through and chooses communities based on their weight, until the next generation has been filled with communities.
-			next_generation_communities_index.append(chooseFromWeight(range(len(successful_individual_generation)), weight_of_communities)) #returns INDEX based on weight of communities
+		weight_of_communities=successful_individual_generation.coverage() #the "weigth" of each community is its sum, which will then determine how likely it is to pass into the next generation
+		#this does the actual SELECTING of communities for the next generation: it chooses number_of_communities communities based on their weight in one go
+		next_generation_communities_index = WeightedSampler(range(len(successful_individual_generation)), weight_of_communities).sampleIndex(number_of_communities, rng).tolist() #returns INDEX based on weight of communities
 	else: #chooses the next generation at random
-		for i in range(number_of_communities): #loops until enough communities have been chosen
-			next_generation_communities_index.append(random.randrange(len(successful_individual_generation))) #chooses between the communities at random (RETURNS INDEX)
+		next_generation_communities_index = rng.integers(len(successful_individual_generation), size=number_of_communities).tolist() #chooses between the communities at random (RETURNS INDEX)
 	return next_generation_communities_index
 
-def selectIndividuals(individual_level_selection_toggle, individual_selection_type, generation, size_of_community):
-	if individual_level_selection_toggle == True: #chooses individuals for the next generation based on how successfully they covered the line segment
-		next_generation_individuals=[]
-		for community in generation: #loops this process for each community in the inputted generation
-			next_community=[] #this will become the newly generated commmunity of individuals
+def selectIndividuals(individual_level_selection_toggle, individual_selection_type, generation, size_of_community, rng):
+	#every community of the next generation gets size_of_community individuals, drawn from the same community of the inputted Generation
+	#(a community with no individuals stays empty). All individuals of all communities are drawn at once.
+	sizes = generation.sizes()
+	next_sizes = numpy.where(sizes>0, size_of_community, 0)
+	next_offsets = numpy.zeros(len(generation)+1, dtype=numpy.int64)
+	next_offsets[1:] = numpy.cumsum(next_sizes)
+	source = numpy.repeat(numpy.arange(len(generation)), next_sizes) #the community each new individual is drawn from
+	starts = generation.offsets[source]
+	stops = generation.offsets[source+1]
+	if individual_level_selection_toggle == True and individual_selection_type != "placement": #chooses individuals for the next generation based on how successfully they covered the line segment
+		if individual_selection_type == "coverage2": #choose based on square of coverage
+			sampler = WeightedSampler(generation.values, numpy.square(generation.values))
+		elif individual_selection_type == "coverage": #choose based coverage
 			#note: the weight of each individual is equal to their length; therefore, we can simply reuse community as the weights.
-			for i in range(size_of_community): #this does the actual SELECTING of individuals for the next generation. It loops through and chooses individuals based on their proportion/weight, until a given next-gen-community has been filled with individuals.
-				if individual_selection_type == "placement": #choose based on number of times placed on interval
-					next_community.append(random.choice(community))
-				elif individual_selection_type == "coverage2": #choose based on square of coverage
-					community_weight=[x**2 for x in community]
-					next_community.append(chooseFromWeight(community, community_weight))
-				elif individual_selection_type == "coverage": #choose based coverage
-					next_community.append(chooseFromWeight(community, community))
-				else: #if I typed something wrong, stop everything
-					sys.exit()
-			next_generation_individuals.append(next_community) #adds the newly selected community to the next generation
-	else: #chooses the next generation at random
-		next_generation_individuals=[]
-		for community in generation: #loops this process for each community in the inputted generation 
-			next_community=[] #this will become the newly generated commmunity of individuals
-			for i in range(size_of_community): #loops until enough individuals have been chosen
-				next_community.append(random.choice(community)) #chooses between the individuals in a community at random
-			next_generation_individuals.append(next_community) #adds the newly selected community to the next generation
-	return next_generation_individuals
+			sampler = WeightedSampler(generation.values, generation.values)
+		else: #if I typed something wrong, stop everything
+			sys.exit()
+		chosen = sampler.sampleIndexWithin(starts, stops, rng)
+	else: #chooses the next generation at random ("placement" also picks at random, since placement already happened)
+		chosen = starts+(rng.random(len(source))*(stops-starts)).astype(numpy.int64) #chooses between the individuals in a community at random
+	return Generation(generation.values[chosen], next_offsets)
+
+
+
+### PARALLEL EXECUTION ###
+def placeCommunities(communities, seed_sequence, countmax, placement_engine): #worker: fills the intervals of a chunk of communities
+	stats = {"attempts": 0, "accepted": 0, "draws": 0}
+	return fillGeneration(communities, countmax, numpy.random.default_rng(seed_sequence), placement_engine, stats), stats
+
+
+def mutateCommunities(communities, seed_sequence, mutation_data): #worker: mutates a chunk of communities
+	return mutateGeneration(communities, mutation_data, numpy.random.default_rng(seed_sequence)), {}
+
+
+def mapCommunities(pool, function, generation, args, generation_index, stage, config, stats=None): #shards a Generation into chunks, runs function(chunk, seed_sequence, *args) on the pool and joins the results back in order
+	#function returns (Generation, stats dict); the stats of all chunks are added into stats
+	chunk_size = config["chunk_size"]
+	if chunk_size<=0: #default to a few chunks per worker so uneven chunks balance out
+		chunk_size = max(1, math.ceil(len(generation)/(4*config["number_of_workers"])))
+	chunks = [generation.slice(j, j+chunk_size) for j in range(0, len(generation), chunk_size)]
+	#every chunk gets its own random stream, derived from the master seed and its position in the run, so results don't depend on which worker runs it
+	seed_sequences = [numpy.random.SeedSequence(config["seed"], spawn_key=(generation_index, stage, n)) for n in range(len(chunks))]
+	results = pool.starmap(function, [(chunks[n], seed_sequences[n])+args for n in range(len(chunks))])
+	if stats is not None:
+		for result_generation, result_stats in results:
+			for key in result_stats:
+				stats[key] = stats[key]+result_stats[key]
+	return Generation.concatenate([result_generation for result_generation, result_stats in results])
+
+
+
+### METRICS ###
+coverageOutputs = ["full", "summary", "both"] #what is written about the coverages of each generation, chosen with --coverage-output
+
+
+class CoverageStatistics: #running summary of the coverages of a generation (mean and variance by Welford's method, min/max, quantiles from a fixed-bin histogram) plus a histogram of the placed lengths
+	quantiles = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+	def __init__(self, coverage_bins=1000, length_bins=20):
+		self.count = 0
+		self.mean = 0.0
+		self.m2 = 0.0 #sum of squared differences from the mean
+		self.min = math.inf
+		self.max = -math.inf
+		self.coverage_histogram = numpy.zeros(coverage_bins, dtype=numpy.int64) #coverage is in [0,1], so fixed bins give quantiles to within 1/coverage_bins
+		self.length_histogram = numpy.zeros(length_bins, dtype=numpy.int64) #number of placed segments with lengths in each equal part of [0,1]
+
+	def update(self, coverage, lengths=()): #adds a batch of coverages (and the lengths placed to get them); can be called any number of times
+		coverage = numpy.asarray(coverage, dtype=numpy.float64)
+		if len(coverage)>0:
+			#Welford's update, for a whole batch at once (Chan et al.): combine the batch mean and sum of squares with the running ones
+			batch_mean = coverage.mean()
+			batch_m2 = numpy.square(coverage-batch_mean).sum()
+			delta = batch_mean-self.mean
+			total = self.count+len(coverage)
+			self.mean = self.mean+delta*len(coverage)/total
+			self.m2 = self.m2+batch_m2+delta**2*self.count*len(coverage)/total
+			self.count = total
+			self.min = min(self.min, coverage.min())
+			self.max = max(self.max, coverage.max())
+			self.coverage_histogram = self.coverage_histogram+self.histogram(coverage, len(self.coverage_histogram))
+		self.length_histogram = self.length_histogram+self.histogram(numpy.asarray(lengths, dtype=numpy.float64), len(self.length_histogram))
+
+	@staticmethod
+	def histogram(values, bins): #counts of values in bins equal parts of [0,1]
+		return numpy.bincount(numpy.clip((values*bins).astype(numpy.int64), 0, bins-1), minlength=bins)
+
+	def variance(self): #population variance (ddof=0, like numpy.var)
+		return self.m2/self.count if self.count>0 else 0.0
+
+	def quantile(self, q): #estimated from the histogram, interpolating linearly inside the bin
+		if self.count==0:
+			return 0.0
+		cumulative = numpy.cumsum(self.coverage_histogram)
+		target = q*self.count
+		j = min(int(numpy.searchsorted(cumulative, target)), len(cumulative)-1)
+		before = cumulative[j-1] if j>0 else 0
+		fraction = (target-before)/self.coverage_histogram[j] if self.coverage_histogram[j]>0 else 0.0
+		return min(max((j+fraction)/len(self.coverage_histogram), self.min), self.max)
+
+	def header(self): #column names for summary()
+		bins = len(self.length_histogram)
+		return (["generation", "communities", "mean", "variance", "min", "max"]+["q"+str(round(q*100)) for q in self.quantiles]+
+			["lengths_"+format(j/bins, "g")+"-"+format((j+1)/bins, "g") for j in range(bins)])
+
+	def summary(self, generation_index): #one row of the coverage summary file
+		if self.count==0:
+			return [generation_index, 0]+[""]*(4+len(self.quantiles))+self.length_histogram.tolist()
+		return ([generation_index, self.count, float(self.mean), float(self.variance()), float(self.min), float(self.max)]+
+			[float(self.quantile(q)) for q in self.quantiles]+self.length_histogram.tolist())
+
+
+def describeSizes(sizes): #summary of a distribution of community sizes
+	if len(sizes)==0:
+		return {"mean": 0, "std": 0, "min": 0, "max": 0}
+	return {"mean": float(numpy.mean(sizes)), "std": float(numpy.std(sizes)), "min": int(numpy.min(sizes)), "max": int(numpy.max(sizes))}
+
+
+class RunMetrics: #times the stages of each generation and collects placement and community size statistics, for a JSON-lines log and a periodic printed summary
+	stages = ["placement", "community_selection", "individual_selection", "mutation", "io"]
+
+	def __init__(self, writer, filename, summary_interval):
+		self.writer = writer
+		self.filename = filename #the JSON-lines metrics log (None to not write one)
+		self.summary_interval = summary_interval #generations between printed summaries (0 for none)
+		self.totals = self.emptyTotals()
+
+	def emptyTotals(self):
+		totals = {"generations": 0, "time": 0.0, "attempts": 0, "accepted": 0, "draws": 0, "placements": 0}
+		for stage in self.stages:
+			totals[stage] = 0.0
+		return totals
+
+	def startGeneration(self):
+		self.stage_times = dict((stage, 0.0) for stage in self.stages)
+		self.placement_stats = {"attempts": 0, "accepted": 0, "draws": 0} #filled in by the placement functions; attempts and accepted count only the rejection loop, draws the rejection-free placements
+		self.start_time = time.perf_counter()
+		self.last_time = self.start_time
+
+	def endStage(self, stage): #adds the time since the last stage ended (or the generation started) to stage
+		now = time.perf_counter()
+		self.stage_times[stage] = self.stage_times[stage]+now-self.last_time
+		self.last_time = now
+
+	def endGeneration(self, i, generation, successful_generation): #records generation i (the generation before placement and the Generation of placed individuals)
+		total_time = time.perf_counter()-self.start_time
+		placement_time = max(self.stage_times["placement"], 1e-12)
+		attempts = self.placement_stats["attempts"]
+		placements = len(successful_generation.values)
+		record = {"generation": i, "time": total_time, "stage_times": self.stage_times,
+			"attempts": attempts, "draws": self.placement_stats["draws"], "placements": placements,
+			"rejection_rate": 1-self.placement_stats["accepted"]/attempts if attempts>0 else None, #None when nothing went through the rejection loop
+			"attempts_per_second": attempts/placement_time, "placements_per_second": placements/placement_time,
+			"community_size": describeSizes(generation.sizes()), "placed_size": describeSizes(successful_generation.sizes())}
+		if self.filename is not None:
+			self.writer.writeLine(self.filename, json.dumps(record))
+		# --- summary since the last one
+		self.totals["generations"] = self.totals["generations"]+1
+		self.totals["time"] = self.totals["time"]+total_time
+		self.totals["attempts"] = self.totals["attempts"]+attempts
+		self.totals["accepted"] = self.totals["accepted"]+self.placement_stats["accepted"]
+		self.totals["draws"] = self.totals["draws"]+self.placement_stats["draws"]
+		self.totals["placements"] = self.totals["placements"]+placements
+		for stage in self.stages:
+			self.totals[stage] = self.totals[stage]+self.stage_times[stage]
+		if self.summary_interval>0 and self.totals["generations"]>=self.summary_interval:
+			self.printSummary(i, record)
+			self.totals = self.emptyTotals()
+
+	def printSummary(self, i, record):
+		totals = self.totals
+		print("Generation "+str(i)+": "+format(totals["time"]/totals["generations"], ".4f")+" s/generation ("+
+			", ".join(stage+" "+format(100*totals[stage]/max(totals["time"], 1e-12), ".0f")+"%" for stage in self.stages)+")")
+		print("  "+format(totals["placements"]/max(totals["placement"], 1e-12), ".0f")+" placements/s, "+
+			format(totals["attempts"]/max(totals["placement"], 1e-12), ".0f")+" attempts/s, "+
+			format(totals["draws"]/max(totals["placement"], 1e-12), ".0f")+" draws/s, rejection rate "+
+			(format(1-totals["accepted"]/totals["attempts"], ".3f") if totals["attempts"]>0 else "n/a")+
+			", community size "+format(record["community_size"]["mean"], ".1f")+" (min "+str(record["community_size"]["min"])+", max "+str(record["community_size"]["max"])+")")
 
 
 
-### COMPILIATION OF COMMANDS ### (uses global variables bc im lazy)
-def iterateGenerations(starting_generation, number_of_generations): #This command iterates through generations of selection number_of_generations number of times
+### COMPILIATION OF COMMANDS ###
+def iterateGenerations(starting_generation, config, rng, writer, pool=None): #This command iterates through generations of selection config["number_of_generations"] number of times. All output goes through writer (a BackgroundWriter); placement and mutation are sharded across pool's worker processes if one is given
+	number_of_generations = config["number_of_generations"]
+	number_of_attempts = config["number_of_attempts"]
+	individual_level_selection_toggle = config["individual_level_selection_toggle"]
+	coveragecsv = "coverage_" + config["run_label"] + ".csv"
+	coveragesummarycsv = "coverage_summary_" + config["run_label"] + ".csv"
 	# A little Sanity Checker (prints "percent complete")
 	percent_done=[]
 	numberoftimechecks=100
 	for i in range(numberoftimechecks):
 		percent_done.append(math.floor(number_of_generations/numberoftimechecks*(i+1)))
 	#################################################################
+	metrics = RunMetrics(writer, "metrics_" + config["run_label"] + ".jsonl" if config["metrics_log"] else None, config["summary_interval"])
 	generation=starting_generation
 	for i in range(number_of_generations): #Iterates through the generations number_of_generations times.
 		# print(generation)
 		start_time=time.time()
-		if i%freqOfGenCollect==0: #once our index hits a multiple of freqOfGenCollect, write the generation to a file
-			generationcsv = "generations_"+ run_label + "_" + str(i) + ".csv"
-			with open(generationcsv, 'w') as csvfile: #writes the generation before selection ###Commented Out bc it takes up time
-				csvwriter = csv.writer(csvfile)
-				csvwriter.writerows(generation)
-		#start_time_gen=time.time()
-		successfulIndividualGeneration=[fillIntervalInf(community, numberOfAttempts) for community in generation] #fills a interval for each community in a generation, returning an array of the successfully placed individuals for each
-		with open(coveragecsv, 'a') as csvfile: #writes the coverage of a community
-			csvwriter = csv.writer(csvfile)
-			csvwriter.writerow([sum(community) for community in successfulIndividualGeneration]) 
+		metrics.startGeneration()
+		if i%config["freq_of_gen_collect"]==0: #once our index hits a multiple of freq_of_gen_collect, write the generation to a file (before selection)
+			if config["generation_format"] in ("binary", "both"):
+				writer.writeGeneration(generation, "generations_"+ config["run_label"] + "_" + str(i) + ".gen")
+			if config["generation_format"] in ("csv", "both"):
+				writer.writeGeneration(generation, "generations_"+ config["run_label"] + "_" + str(i) + ".csv")
+		metrics.endStage("io")
+		if pool is None:
+			successfulIndividualGeneration=fillGeneration(generation, number_of_attempts, rng, config["placement_engine"], metrics.placement_stats) #fills a interval for each community in a generation, returning an array of the successfully placed individuals for each
+		else:
+			successfulIndividualGeneration=mapCommunities(pool, placeCommunities, generation, (number_of_attempts, config["placement_engine"]), i, 0, config, metrics.placement_stats)
+		metrics.endStage("placement")
+		coverage = successfulIndividualGeneration.coverage()
+		if config["coverage_output"] in ("full", "both"):
+			writer.writeRow(coveragecsv, coverage) #writes the coverage of a community
+		if config["coverage_output"] in ("summary", "both"): #writes only summary statistics of the coverages (and a histogram of the placed lengths)
+			coverage_statistics = CoverageStatistics(length_bins=config["length_bins"])
+			coverage_statistics.update(coverage, successfulIndividualGeneration.values)
+			writer.writeRow(coveragesummarycsv, coverage_statistics.summary(i))
+		metrics.endStage("io")
 		# print(successfulIndividualGeneration)
 		# print(sum(successfulIndividualGeneration[0])) #prints the length (e.g. weight) of first community's interval
-		# print("Placement: "+str(time.time()-start_time)) #TIME CHECK
 		
-		nextGenerationCommunitiesIndex=selectCommunitiesIndex(communityLevelSelectionToggle, successfulIndividualGeneration, numberOfCommunities) #Selects numberOfCommunities communities (by index) for the next generation. See the selectCommunitiesIndex function for more details.
-		# print("Community Index Select: "+str(time.time()-start_time)) #TIME CHECK
-		if individualLevelSelectionToggle==True: #if we are selecting individiuals based on performance
-			if numpy.any(numpy.array([len(successfulIndividualGeneration[i]) for i in nextGenerationCommunitiesIndex])==0): # ensure we don't pass an empty community
-				nextGenerationCommunities=[None]*len(nextGenerationCommunitiesIndex)
-				for n in range(len(nextGenerationCommunitiesIndex)):
-					index = nextGenerationCommunitiesIndex[n]
-					if successfulIndividualGeneration[index]==[]: # if selected community didn't place anything
-						nextGenerationCommunities[n]=generation[index] # use the original community instead
-					else:
-						nextGenerationCommunities[n]=successfulIndividualGeneration[index]
+		nextGenerationCommunitiesIndex=selectCommunitiesIndex(config["community_level_selection_toggle"], successfulIndividualGeneration, config["number_of_communities"], rng) #Selects number_of_communities communities (by index) for the next generation. See the selectCommunitiesIndex function for more details.
+		if individual_level_selection_toggle==True: #if we are selecting individiuals based on performance
+			nextGenerationCommunitiesIndex=numpy.array(nextGenerationCommunitiesIndex)
+			emptyCommunities=successfulIndividualGeneration.sizes()[nextGenerationCommunitiesIndex]==0
+			if numpy.any(emptyCommunities): # ensure we don't pass an empty community
+				# if selected community didn't place anything, use the original community instead (the originals come after the successful ones in the combined generation)
+				nextGenerationCommunities=Generation.concatenate([successfulIndividualGeneration, generation]).take(numpy.where(emptyCommunities, nextGenerationCommunitiesIndex+len(successfulIndividualGeneration), nextGenerationCommunitiesIndex))
 			else:
-				nextGenerationCommunities=[successfulIndividualGeneration[i] for i in nextGenerationCommunitiesIndex]
+				nextGenerationCommunities=successfulIndividualGeneration.take(nextGenerationCommunitiesIndex)
 		else: # if we are selecting individuals based on drift
-			nextGenerationCommunities=[generation[i] for i in nextGenerationCommunitiesIndex] #pass the original generation list
-		# print("Community Select: "+str(time.time()-start_time)) #TIME CHECK
+			nextGenerationCommunities=generation.take(nextGenerationCommunitiesIndex) #pass the original generation list
+		metrics.endStage("community_selection")
 		
-		nextGenerationIndividuals=selectIndividuals(individualLevelSelectionToggle, individualSelectionType, nextGenerationCommunities, commGenData["size_of_community"]) #Selects sizeOfCommunity individuals for the next generation. See the selectIndividiuals function for more details.
-		# print("Individual Select: "+str(time.time()-start_time)) #TIME CHECK
+		nextGenerationIndividuals=selectIndividuals(individual_level_selection_toggle, config["individual_selection_type"], nextGenerationCommunities, config["comm_gen_data"]["size_of_community"], rng) #Selects size_of_community individuals for the next generation. See the selectIndividiuals function for more details.
+		metrics.endStage("individual_selection")
 		# print(nextGenerationIndividuals)
-		mutatedGeneration=[mutateCommunity(community, mutationData) for community in nextGenerationIndividuals]
-		# print("Mutations: "+str(time.time()-start_time)) #TIME CHECK
+		if pool is None:
+			mutatedGeneration=mutateGeneration(nextGenerationIndividuals, config["mutation_data"], rng)
+		else:
+			mutatedGeneration=mapCommunities(pool, mutateCommunities, nextGenerationIndividuals, (config["mutation_data"],), i, 1, config)
+		metrics.endStage("mutation")
+		metrics.endGeneration(i, generation, successfulIndividualGeneration)
 		# print(mutatedGeneration)
 		generation=mutatedGeneration
 		#################################################################
-		if i in percent_done: #prints when we're X% done (just for my own sanity)
+		if config["print_progress"] and i in percent_done: #prints when we're X% done (just for my own sanity)
 			print(str(math.floor((i+1)/number_of_generations*100)) + "% Percent Done!")
 			print("Time of Most-Recent Run: "+str(time.time()-start_time))
 		#end_time_gen=time.time()
@@ -232,91 +898,250 @@ def iterateGenerations(starting_generation, number_of_generations): #This comman
 	#print(generation)
 
 
+def runSimulation(config): #runs one full simulation (starting generation, all generations, output files) for a config made by makeConfig
+	if config["print_progress"]:
+		print("Seed: "+str(config["seed"]))
+	rng = numpy.random.default_rng(config["seed"]) #the random stream for everything that happens in this process
+	commGenData = config["comm_gen_data"]
+	if commGenData["type_of_community"]=="from-csv":
+		if os.path.exists(commGenData["seed_csv"]):
+			startingGeneration=importGeneration(commGenData["seed_csv"])
+		else:
+			print("Seed does not exist.")
+			sys.exit()
+	else:
+		startingGeneration=Generation.fromLists([getCommunity(commGenData, rng) for i in range(config["number_of_communities"])])
+	if config["coverage_output"] in ("full", "both"):
+		with open("coverage_" + config["run_label"] + ".csv", 'w') as csvfile: #creates (or empties) the coverage file
+			pass
+	if config["coverage_output"] in ("summary", "both"):
+		with open("coverage_summary_" + config["run_label"] + ".csv", 'w') as csvfile: #creates the coverage summary file, with a header
+			csvwriter = csv.writer(csvfile)
+			csvwriter.writerow(CoverageStatistics(length_bins=config["length_bins"]).header())
+	pool = multiprocessing.Pool(config["number_of_workers"]) if config["number_of_workers"]>1 else None #placement and mutation are sharded across worker processes; selection always happens here. Started before the writer thread, so no worker is forked from a process with a running thread
+	try:
+		writer = BackgroundWriter(config["flush_interval"], config["flush_rows"])
+		try:
+			iterateGenerations(startingGeneration, config, rng, writer, pool)
+		finally: #always write out what has been queued, even if the run failed
+			writer.close()
+	finally: #stops the workers even if the run failed part way through
+		if pool is not None:
+			pool.terminate()
+			pool.join()
+	return config["run_label"]
+
+
+
+### Run Options ###
+def parseOptions(argv): #splits optional "--name value" arguments from the positional ones
+	arguments = []
+	options = {}
+	j = 0
+	while j<len(argv):
+		if argv[j].startswith("--"):
+			options[argv[j][2:]] = argv[j+1]
+			j = j+2
+		else:
+			arguments.append(argv[j])
+			j = j+1
+	return arguments, options
+
+
+#names of the positional arguments, in order (arguments[1] is the first one; arguments[0] is the script). Used to name them in sweep files.
+argumentNames = ["individual_level_selection", "community_level_selection", "number_of_attempts", "individual_selection_type", "type_of_community",
+	"mutation_type", "number_of_generations", "number_of_communities", "size_of_community", "length_or_seed_csv", "seed_label"]
+
+
+def makeConfig(arguments, options, label_suffix=""): #builds the config of a run from the positional arguments and "--name value" options
+	config = {}
+	config["number_of_workers"] = int(options.get("workers", 1)) #number of processes used for placement and mutation (1 runs everything in this process)
+	config["chunk_size"] = int(options.get("chunk-size", 0)) #number of communities sent to a worker at once (0 picks one automatically)
+	if "seed" in options:
+		config["seed"] = int(options["seed"]) #all random streams of a run are derived from this
+	else:
+		config["seed"] = numpy.random.SeedSequence().entropy #fresh seed; printed at the start of the run so it can be replayed
+	config["print_progress"] = True #prints the seed and "% Percent Done!" while running
+
+	### Community Generation Variables ###
+	commGenData = {}
+	# !!! INPUTTED BY SYSTEM ARGUMENT !!! #
+	commGenData["type_of_community"]=arguments[5] #type of starting community (options: "uniform", "homogeneous", "n-member", or "from-csv" (which also reads .gen snapshots))
+	if commGenData["type_of_community"] not in ("uniform", "homogeneous", "n-member", "from-csv"):
+		print("Incorrect starting community type entered. Please choose from uniform, homogeneous, n-member, or from-csv.")
+		sys.exit()
+	# --- All Community
+	commGenData["size_of_community"]=int(arguments[9]) #number of segments in a community
+	# --- Uniform Community
+	commGenData["min_length"]=0.005 #minimum length of a segment in Uniformed Random Distribution community
+	commGenData["max_length"]=1 #maximum length of a segment in Uniformed Random Distribution community
+	# --- Homogeneous Community
+	if commGenData["type_of_community"]=="homogeneous":
+		#commGenData["length"]=float(input("Input length of all community members (float between 0 and 1): ")) #length of a segment in a Homogeneous community
+		commGenData["length"]=float(arguments[10])
+		commGenData["type_of_community_label"]=commGenData["type_of_community"]+str(commGenData["length"])#.replace("0.","")
+	elif commGenData["type_of_community"]=="from-csv":
+		commGenData["seed_csv"]=arguments[10]
+		commGenData["seed_label"]=arguments[11]
+		commGenData["type_of_community_label"]=commGenData["type_of_community"]+str(commGenData["seed_label"])#.replace("0.","")
+	else:
+		commGenData["type_of_community_label"]=commGenData["type_of_community"]
+	# --- N-Membered Community
+	commGenData["length_list"]=[0.01, 0.877] #length of segments in an n member community
+	commGenData["community_weight_list"]=[0.5,0.5] #proportions of each segment-length in an n member community ***DOESEN'T WORK IF ONE HAS PROPORTION OF 0
+	config["comm_gen_data"] = commGenData
+
+	### Mutation Variables ###
+	mutationData = {}
+	mutationData["mutation_type"]=arguments[6]
+	# ---Used for all mutation types
+	mutationData["mutation_probability"]=0.1 #probability of mutating any given line segment (used for ALL)
+	mutationData["min_mutation_size"]=0.001 #minimum allowed mutation size (used for ALL, optional for NORMAL/POISSON)
+	mutationData["max_mutation_size"]=0.1 #maximum allowed mutation size (used for ALL, optional for NORMAL/POISSON)
+	# ---Normal
+	mutationData["mutation_standard_deviation"]=0.005 #standard deviation of mutations (used for NORMAL)
+	mutationData["mutation_delta"]=0.001 #discretizes mutation size (used for NORMAL)
+	# ---Poisson
+	mutationData["mutation_mean_size"]=0.01 #mean size of a mutation (used for POISSON)
+	# ---Culling (segments mutated outside these sizes are removed)
+	mutationData["min_segment_size"]=0.005 #minimum allowable segment size (overall)
+	mutationData["max_segment_size"]=1 #maximum allowable segment size (overall)
+	if mutationData["mutation_type"] not in mutationTypes: #checked here, before any work is sent to worker processes (where sys.exit() in drawMutations would only stop the worker)
+		print("Incorrect mutation type entered. Please choose from uniform, poisson, or normal.")
+		sys.exit()
+	config["mutation_data"] = mutationData
 
-### Community Generation Variables ###
-commGenData = {}
-# !!! INPUTTED BY SYSTEM ARGUMENT !!! #
-commGenData["type_of_community"]=sys.argv[5] #type of starting community (options: "uniform", "homogeneous", "n-member", or "from-csv")
-# --- All Community
-commGenData["size_of_community"]=int(sys.argv[9]) #number of segments in a community
-# --- Uniform Community
-commGenData["min_length"]=0.005 #minimum length of a segment in Uniformed Random Distribution community
-commGenData["max_length"]=1 #maximum length of a segment in Uniformed Random Distribution community
-# --- Homogeneous Community
-if commGenData["type_of_community"]=="homogeneous":
-	#commGenData["length"]=float(input("Input length of all community members (float between 0 and 1): ")) #length of a segment in a Homogeneous community
-	commGenData["length"]=float(sys.argv[10])
-	commGenData["type_of_community_label"]=commGenData["type_of_community"]+str(commGenData["length"])#.replace("0.","")
-elif commGenData["type_of_community"]=="from-csv":
-	commGenData["seed_csv"]=sys.argv[10]
-	commGenData["seed_label"]=sys.argv[11]
-	commGenData["type_of_community_label"]=commGenData["type_of_community"]+str(commGenData["seed_label"])#.replace("0.","")
-else:
-	commGenData["type_of_community_label"]=commGenData["type_of_community"]
-# --- N-Membered Community
-commGenData["length_list"]=[0.01, 0.877] #length of segments in an n member community
-commGenData["community_weight_list"]=[0.5,0.5] #proportions of each segment-length in an n member community ***DOESEN'T WORK IF ONE HAS PROPORTION OF 0
-
-
-### Mutation Variables ###
-mutationData = {}
-mutationData["mutation_type"]=sys.argv[6]
-# ---Used for all mutation types
-mutationData["mutation_probability"]=0.1 #probability of mutating any given line segment (used for ALL)
-mutationData["min_mutation_size"]=0.001 #minimum allowed mutation size (used for ALL, optional for NORMAL/POISSON)
-mutationData["max_mutation_size"]=0.1 #maximum allowed mutation size (used for ALL, optional for NORMAL/POISSON)
-# ---Normal
-mutationData["mutation_standard_deviation"]=0.005 #standard deviation of mutations (used for NORMAL)
-mutationData["mutation_delta"]=0.001 #discretizes mutation size (used for NORMAL)
-# ---Poisson
-mutationData["mutation_mean_size"]=0.01 #mean size of a mutation (used for POISSON)
-
-### Interval Placement Variables ###
-minSegmentSize=0.005 #minimum allowable segment size (overall)
-maxSegmentSize=1 #maximum allowable segment size (overall)
-# !!! INPUTTED BY SYSTEM ARGUMENT !!! #
-if sys.argv[3]=="inf":
-	numberOfAttempts = math.inf
-else:
-	numberOfAttempts = int(sys.argv[3]) #this is the maximum number of times we will attempt to place a segment 
-
-### Type of Program
-# !!! INPUTTED BY SYSTEM ARGUMENT !!! #
-individualLevelSelectionToggle = sys.argv[1].lower() == "true" #determines whether individual level selection happens
-communityLevelSelectionToggle = sys.argv[2].lower() == "true" #determines whether community level selection happens
-
-# !!! INPUTTED BY SYSTEM ARGUMENT !!! #
-individualSelectionType = sys.argv[4] #type of individual level selection (options: "coverage", "coverage2", and "placement")
-numberOfCommunities = int(sys.argv[8]) #the number of communities in a given generation (i.e. length of the array of generation)
-# !!! INPUTTED BY SYSTEM ARGUMENT !!! #
-numberOfGenerations = int(sys.argv[7])+1 #number of times the program will be run/looped through #its +1 so we collect generation files up to numberOfGenerations 
-
-freqOfGenCollect = 25 #frequency with which to collect generational data
-
-if individualLevelSelectionToggle == True:
-	if communityLevelSelectionToggle == True:
-		selectionType = "indcom"
+	### Interval Placement Variables ###
+	# !!! INPUTTED BY SYSTEM ARGUMENT !!! #
+	if arguments[3]=="inf":
+		config["number_of_attempts"] = math.inf
 	else:
-		selectionType = "inddrf"
-else:
-	if communityLevelSelectionToggle == True:
-		selectionType = "drfcom"
+		config["number_of_attempts"] = int(arguments[3]) #this is the maximum number of times we will attempt to place a segment 
+	config["placement_engine"] = options.get("placement-engine", "rejection") #how intervals are filled (options: "rejection" (random placements, rejecting invalid ones) or "kinetic" (rejection-free, only used when number_of_attempts is inf), or "batch" (all communities of a generation at once with numpy arrays))
+	if config["placement_engine"] not in placementEngines:
+		print("Incorrect placement engine entered. Please choose from "+", ".join(placementEngines)+".")
+		sys.exit()
+
+	### Type of Program
+	# !!! INPUTTED BY SYSTEM ARGUMENT !!! #
+	config["individual_level_selection_toggle"] = arguments[1].lower() == "true" #determines whether individual level selection happens
+	config["community_level_selection_toggle"] = arguments[2].lower() == "true" #determines whether community level selection happens
+
+	# !!! INPUTTED BY SYSTEM ARGUMENT !!! #
+	config["individual_selection_type"] = arguments[4] #type of individual level selection (options: "coverage", "coverage2", and "placement")
+	if config["individual_level_selection_toggle"] == True and config["individual_selection_type"] not in ("coverage", "coverage2", "placement"):
+		print("Incorrect individual selection type entered. Please choose from coverage, coverage2, or placement.")
+		sys.exit()
+	config["number_of_communities"] = int(arguments[8]) #the number of communities in a given generation (i.e. length of the array of generation)
+	# !!! INPUTTED BY SYSTEM ARGUMENT !!! #
+	config["number_of_generations"] = int(arguments[7])+1 #number of times the program will be run/looped through #its +1 so we collect generation files up to number_of_generations 
+
+	### Output ###
+	config["freq_of_gen_collect"] = 25 #frequency with which to collect generational data
+	config["flush_interval"] = float(options.get("flush-interval", 10)) #seconds between flushes of the output files
+	config["flush_rows"] = int(options.get("flush-rows", 100)) #number of coverage rows written before the output files are flushed early
+	if config["flush_interval"]<=0 or config["flush_rows"]<1:
+		print("Incorrect flush settings entered. Please choose a flush interval above 0 and at least 1 flush row.")
+		sys.exit()
+	config["coverage_output"] = options.get("coverage-output", "full") #coverage output (options: "full" (every community's coverage, every generation), "summary" (mean, variance, min/max, quantiles and a histogram of placed lengths per generation), or "both")
+	if config["coverage_output"] not in coverageOutputs:
+		print("Incorrect coverage output entered. Please choose from "+", ".join(coverageOutputs)+".")
+		sys.exit()
+	config["length_bins"] = int(options.get("length-bins", 20)) #number of bins of the placed length histogram in the coverage summary
+	config["metrics_log"] = options.get("metrics", "false").lower() == "true" #writes per-generation stage times, placement rates and community sizes to metrics_<run_label>.jsonl
+	config["summary_interval"] = int(options.get("summary-every", 0)) #prints a summary of the metrics every this many generations (0 for never)
+	config["generation_format"] = options.get("generation-format", "binary") #format of the collected generations (options: "binary" (.gen, can be seeded from with from-csv), "csv", or "both")
+	if config["generation_format"] not in generationFormats:
+		print("Incorrect generation format entered. Please choose from "+", ".join(generationFormats)+".")
+		sys.exit()
+
+	if config["individual_level_selection_toggle"] == True:
+		if config["community_level_selection_toggle"] == True:
+			selectionType = "indcom"
+		else:
+			selectionType = "inddrf"
 	else:
-		selectionType = "drfdrf"
+		if config["community_level_selection_toggle"] == True:
+			selectionType = "drfcom"
+		else:
+			selectionType = "drfdrf"
 
+	# name based on the run-type
+	datetime_label = datetime.now().strftime("%Y%m%d_%H%M%S")
+	config["run_label"] = "_".join([str(config["number_of_attempts"]), config["individual_selection_type"], commGenData["type_of_community_label"], mutationData["mutation_type"],
+		selectionType, str(config["number_of_generations"]-1), str(config["number_of_communities"]), str(commGenData["size_of_community"]), datetime_label]) + label_suffix
+	return config
 
-### Setting Up CSV Files ### 
 
-# name based on the run-type
-datetime_label = datetime.now().strftime("%Y%m%d_%H%M%S")
-run_label = "_".join([str(numberOfAttempts), individualSelectionType, commGenData["type_of_community_label"], mutationData["mutation_type"],
-	selectionType, str(numberOfGenerations-1), str(numberOfCommunities), str(commGenData["size_of_community"]), datetime_label])
-coveragecsv = "coverage_" + run_label + ".csv"
 
+### Parameter Sweeps ###
+#A sweep file is JSON, e.g.
+#	{"base": {"individual_level_selection": "True", "community_level_selection": "True", "number_of_attempts": "inf", "individual_selection_type": "coverage",
+#		"type_of_community": "uniform", "mutation_type": "normal", "number_of_generations": 1000, "number_of_communities": 100, "size_of_community": 100},
+#	 "grid": {"individual_selection_type": ["coverage", "coverage2", "placement"], "mutation_type": ["uniform", "normal"]},
+#	 "replicates": 3,
+#	 "options": {"generation-format": "binary"}}
+#"base" names the positional arguments (see argumentNames), "grid" lists the values to sweep over (every combination is run), and "options" are
+#"--name value" options given to every run. Run it with: line_packingV3a.py --sweep sweep.json [--sweep-workers N] [--seed N] [--name value ...]; any other
+#options on the command line are also given to every run, unless the sweep file's "options" set them too.
+def makeSweepConfigs(sweep, options): #expands a sweep into one config per combination and replicate
+	grid_names = list(sweep.get("grid", {}))
+	unknown_names = [name for name in list(sweep.get("base", {}))+grid_names if name not in argumentNames]
+	if unknown_names: #a misspelt name would otherwise be dropped, giving several runs with the same arguments
+		print("Unknown argument(s) in sweep file: "+", ".join(unknown_names)+". Please choose from "+", ".join(argumentNames)+".")
+		sys.exit()
+	combinations = [{}]
+	for name in grid_names: #every combination of the grid values
+		combinations = [dict(combination, **{name: value}) for combination in combinations for value in sweep["grid"][name]]
+	replicates = int(sweep.get("replicates", 1))
+	run_options = dict((name, value) for name, value in options.items() if name not in ("sweep", "sweep-workers", "seed")) #options from the command line go to every run,
+	run_options.update(sweep.get("options", {})) #but the sweep file's options take precedence
+	run_options["workers"] = 1 #runs are already spread across the sweep's worker processes
+	configs = []
+	for combination in combinations:
+		values = dict(sweep.get("base", {}), **combination)
+		given = [j for j in range(len(argumentNames)) if argumentNames[j] in values]
+		number_of_arguments = max(given+[argumentNames.index("size_of_community")])+1 #every argument up to size_of_community is needed, the rest only as far as they are given
+		missing_names = [name for name in argumentNames[:number_of_arguments] if name not in values]
+		if missing_names: #arguments are positional, so a gap would shift every later one
+			print("Missing argument(s) in sweep file: "+", ".join(missing_names)+".")
+			sys.exit()
+		arguments = [sys.argv[0]]+[str(values[name]) for name in argumentNames[:number_of_arguments]]
+		for replicate in range(replicates):
+			run_number = len(configs)
+			#each run gets its own seed, derived from the sweep seed and the run's position in the sweep
+			run_options["seed"] = numpy.random.SeedSequence(int(options["seed"]), spawn_key=(run_number,)).generate_state(1)[0] if "seed" in options else numpy.random.SeedSequence().entropy
+			config = makeConfig(arguments, run_options, "_r"+str(replicate) if replicates>1 else "") #also checks the types and options of the run, here in the parent
+			config["print_progress"] = False
+			if config["comm_gen_data"]["type_of_community"]=="from-csv" and not os.path.exists(config["comm_gen_data"]["seed_csv"]):
+				print("Seed does not exist: "+config["comm_gen_data"]["seed_csv"])
+				sys.exit()
+			configs.append(config)
+	run_labels = [config["run_label"] for config in configs]
+	repeated_labels = sorted(set(label for label in run_labels if run_labels.count(label)>1))
+	if repeated_labels: #runs with the same label would write over each other's files
+		print("Several runs of the sweep have the same label: "+", ".join(repeated_labels)+".")
+		sys.exit()
+	return configs
+
+
+def runSweepSimulation(config): #worker: runs one simulation of a sweep. sys.exit() in a pool worker would stop the worker and leave the sweep waiting for its result forever, so it is turned into an ordinary error that reaches the parent
+	try:
+		return runSimulation(config)
+	except SystemExit:
+		raise RuntimeError("Run "+config["run_label"]+" stopped early (see the message above).")
+
+
+def runSweep(sweep_file, options): #runs every configuration of a sweep file, spread across long-lived worker processes
+	with open(sweep_file, 'r') as jsonfile:
+		sweep = json.load(jsonfile)
+	configs = makeSweepConfigs(sweep, options)
+	number_of_workers = int(options.get("sweep-workers", os.cpu_count()))
+	print("Running "+str(len(configs))+" runs on "+str(number_of_workers)+" workers.")
+	with multiprocessing.Pool(number_of_workers) as pool: #each worker imports numpy once and then runs many simulations
+		for n, run_label in enumerate(pool.imap_unordered(runSweepSimulation, configs)):
+			print(str(n+1)+"/"+str(len(configs))+" Done: "+run_label)
 
-with open(coveragecsv, 'w') as csvfile:  
-    # creating a csv writer object  
-    csvwriter = csv.writer(csvfile)  
 
 
 ### BEGIN PROGRAM ###
@@ -340,16 +1165,12 @@ with open(coveragecsv, 'w') as csvfile:
 
 
 ### ITERATE GENERATIONS - MAIN PROGRAM ###
-if commGenData["type_of_community"]=="from-csv":
-	if os.path.exists(commGenData["seed_csv"]):
-		startingGeneration=importGeneration(commGenData["seed_csv"])
+if __name__ == "__main__": #keeps worker processes that import this file from starting a run of their own
+	arguments, runOptions = parseOptions(sys.argv)
+	if "sweep" in runOptions:
+		runSweep(runOptions["sweep"], runOptions)
 	else:
-		print("Seed does not exist.")
-		sys.exit()
-
-else:
-	startingGeneration=[getCommunity(commGenData) for i in range(numberOfCommunities)]
-iterateGenerations(startingGeneration, numberOfGenerations)
+		runSimulation(makeConfig(arguments, runOptions))
 
 
 # successfulIndividualGeneration = [[1,1,1,1],[0.1,0.1,0.1,0.1],[0.2,0.2,0.2,0.2]]